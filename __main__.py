@@ -7,7 +7,8 @@ from pathlib import Path
 
 # Import custom modules
 from config import CA_NAMES, OUTPUT_PATH, OUTPUT_INVALID_PATH
-from data.scraper import SINACPayloadSraper, SINACRedScraper
+from data.scraper import SINACPayloadSraper, SINACRedScraper, create_session, new_log_file
+from utils.export import fast_to_csv
 
 # This file was used to check the scraping process and the data extraction process
 
@@ -28,6 +29,12 @@ def parse_arguments():
         default=False,
         help="Decide whether or not to skip the payload generation. Must only be used if the last execution contained the necessary payloads"
     )
+    parser.add_argument(
+        "--cache",
+        action='store_true',
+        default=False,
+        help="Reuse the on-disk responses of the last 24 hours, to speed up development and restarts. Results may be stale."
+    )
     parser.add_argument(
         "--output_data", 
         type=str, 
@@ -50,42 +57,60 @@ def parse_arguments():
     
     return parser.parse_args()
 
-def save_by_community(data_df, invalid_mun_df, args):
+async def save_by_community(data_df, invalid_mun_df, args):
     """Save the data and invalid municipalities by community."""
+    # Split each frame once instead of filtering it for every community
+    data_groups = dict(list(data_df.groupby('Comunidad Autónoma', sort=False)))
+    invalid_groups = dict(list(invalid_mun_df.groupby('Comunidad Autónoma', sort=False)))
+
+    writes = []
     for com_id in args.com_ids:
         com_name = CA_NAMES[com_id-1]
-        com_data_df = data_df[data_df['Comunidad Autónoma'] == com_name]
-        com_invalid_mun_df = invalid_mun_df[invalid_mun_df['Comunidad Autónoma'] == com_name]
+        com_data_df = data_groups.get(com_name, data_df.iloc[:0])
+        com_invalid_mun_df = invalid_groups.get(com_name, invalid_mun_df.iloc[:0])
 
         data_filepath = Path(args.output_data.replace("/", f"/{com_name}/")) 
         data_filepath.parent.mkdir(parents=True, exist_ok=True) 
         invalid_filepath = Path(args.output_invalid.replace("/", f"/{com_name}/")) 
         invalid_filepath.parent.mkdir(parents=True, exist_ok=True) 
 
-        com_data_df.to_csv(data_filepath, index=False)
-        com_invalid_mun_df.to_csv(invalid_filepath, index=False)
+        writes.append(asyncio.to_thread(fast_to_csv, com_data_df, data_filepath))
+        writes.append(asyncio.to_thread(fast_to_csv, com_invalid_mun_df, invalid_filepath))
+
+    await asyncio.gather(*writes)
 
 async def main(args):
     print("Community names to process:", [CA_NAMES[i-1] for i in args.com_ids])
-    if args.skip_payload:
-        payload_df = None
-        print("Payload generation skipped. Using the last generated payloads.")
-    else:
-        payload_time = time.time()
-        payload_scraper = SINACPayloadSraper(args.com_ids)
-        payload_df = await payload_scraper.scrape()
-        print("Time taken to extract", len(payload_df), "payloads:", time.time() - payload_time)
-        print("\n\n---------------EXTRACTED ALL THE REQUIRED PAYLOADS---------------\n\n")
-    data_time = time.time()
-    data_scraper = SINACRedScraper(payload_df)
-    data_df, invalid_mun_df = await data_scraper.scrape()
+    # Both scrapers write to the same log file for this run
+    log_file = new_log_file()
+    # The scrapers' own loggers take precedence over the level of their 'sinac' parent
+    for name in ('payload', 'red'):
+        logging.getLogger(f'sinac.{name}').setLevel(args.log.upper())
+    # A single session keeps the connection pool alive across both scraping phases
+    async with create_session() as session:
+        if args.skip_payload:
+            payload_df = None
+            print("Payload generation skipped. Using the last generated payloads.")
+        else:
+            payload_time = time.time()
+            payload_scraper = SINACPayloadSraper(
+                args.com_ids, session=session, log_file=log_file, use_cache=args.cache
+            )
+            payload_df = await payload_scraper.scrape()
+            print("Time taken to extract", len(payload_df), "payloads:", time.time() - payload_time)
+            print("\n\n---------------EXTRACTED ALL THE REQUIRED PAYLOADS---------------\n\n")
+        data_time = time.time()
+        data_scraper = SINACRedScraper(
+            payload_df, session=session, log_file=log_file, use_cache=args.cache
+        )
+        data_df, invalid_mun_df = await data_scraper.scrape()
     print("Time taken to extract", len(data_df), "data points:", time.time() - data_time)
     print("\n\n---------------EXTRACTED ALL THE REQUIRED DATA---------------\n\n")
     if len(args.com_ids) != len(CA_NAMES):
-        save_by_community(data_df, invalid_mun_df, args)
+        await save_by_community(data_df, invalid_mun_df, args)
     else:
-        data_df.to_csv(args.output_data, index=False)
-        invalid_mun_df.to_csv(args.output_invalid, index=False)
+        fast_to_csv(data_df, args.output_data)
+        fast_to_csv(invalid_mun_df, args.output_invalid)
     
     print("Data saved to output directory.")
     return data_df, invalid_mun_df
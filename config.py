@@ -1,4 +1,5 @@
 CA_NAMES = ['Andalucía', 'Aragón', 'Asturias', 'Baleares', 'Canarias', 'Cantabria', 'Castilla y León', 'Castilla-La Mancha', 'Cataluña', 'Comunidad Valenciana', 'Extremadura', 'Galicia', 'Madrid', 'Murcia', 'Navarra', 'País Vasco', 'La Rioja', 'Ceuta', 'Melilla'] # The names of the communities
+CA_NAME_TO_ID = {name: i + 1 for i, name in enumerate(CA_NAMES)} # Community IDs are 1-based
 PARAMETER_CODES = {26, 46, 47, 51, 52, 53, 64, 65, 66, 67}
 
 PROV_URL = "https://sinac.sanidad.gob.es/CiudadanoWeb/ciudadano/cargarComboProvinciasAction.do"
@@ -6,10 +7,10 @@ MUN_URL = "https://sinac.sanidad.gob.es/CiudadanoWeb/ciudadano/cargarComboMunici
 NET_URL = 'https://sinac.sanidad.gob.es/CiudadanoWeb/ciudadano/informacionRedes.do'
 CONTENT_URL = 'https://sinac.sanidad.gob.es/CiudadanoWeb/ciudadano/informacionAbastecimientoActionDetalleRed.do'
 
-PAYLOAD_PATH = "data/payloads.pkl"
-RED_PAYLOAD_PATH = "data/red_payloads.pkl"
-RED_PATH = "data/red_data.pkl"
-INVALID_PATH = "data/invalid_municipalities.pkl"
+PAYLOAD_PATH = "data/payloads.feather"
+RED_PAYLOAD_PATH = "data/red_payloads.feather"
+RED_PATH = "data/red_data.feather"
+INVALID_PATH = "data/invalid_municipalities.feather"
 
 # output as excel files
 OUTPUT_PATH = "output/datos_calidad_SINAC.xlsx"
@@ -21,6 +22,10 @@ INVALID_MUN_FILENAME = 'municipios_inválidos.xlsx'
 LOG_FILENAME = 'scraper_log.txt'
 
 RETRIES = 4
+CHECKPOINT_INTERVAL = 30 # Seconds between checkpoints of the red scraper results
+
+CACHE_PATH = '.sinac_cache' # On-disk cache of the server responses
+CACHE_EXPIRE = 86400 # Seconds before a cached response is requested again
 
 CORRECT_PASSWORD = 'a946ba1542381a93b8c41de17e586d69c2382637fbb46451a812715d82ad5d59'
 
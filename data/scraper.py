@@ -1,22 +1,40 @@
-import aiohttp
+import httpx
+import diskcache
 import asyncio
+import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
-from typing import List, Tuple, Dict, Any, Optional
+from selectolax.parser import HTMLParser
+from typing import List, Tuple, Dict, Any, Optional, Union
+from urllib.parse import urlencode
+from io import StringIO
 import logging
 from logging.handlers import RotatingFileHandler
-from aiohttp import ClientTimeout
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, RetryCallState
+from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception_type, RetryCallState
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 from tqdm.asyncio import tqdm as async_tqdm
-import pickle
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 from config import CA_NAMES, PROV_URL, MUN_URL, PAYLOAD_PATH, NET_URL, RED_PAYLOAD_PATH, \
-    RED_PATH, INVALID_PATH, CONTENT_URL, PARAMETER_CODES, SCRAPER_LOG, RETRIES
+    RED_PATH, INVALID_PATH, CONTENT_URL, PARAMETER_CODES, SCRAPER_LOG, RETRIES, CHECKPOINT_INTERVAL, \
+    CACHE_PATH, CACHE_EXPIRE
 from utils.ratelimiter import RateLimiter
+from utils.workerpool import run_worker_pool
+
+# Longest wait honoured from a Retry-After header, the same as the longest backoff of the red scraper
+MAX_RETRY_AFTER = 60.0
+
+# Used by np.isin when filtering the tables. Built here so config stays free of dependencies.
+_PARAMETER_CODES_ARR = np.array(sorted(PARAMETER_CODES), dtype=np.int64)
+
+# Locates the parameter table after the 'Últimos valor notificado de los parámetros...' heading.
+# The anchor is kept ASCII so it matches regardless of the page encoding.
+_TABLE_RE = re.compile(rb'ltimos valor notificado de los par.*?(<table.*?</table>)', re.DOTALL)
 
 class RequestError(Exception):
     """Base class for request-related errors."""
@@ -24,7 +42,9 @@ class RequestError(Exception):
 
 class TooManyRequestsError(RequestError):
     """Raised when receiving a 429 Too Many Requests response."""
-    pass
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
 
 class NetworkError(RequestError):
     """Raised for network-related errors."""
@@ -34,29 +54,106 @@ class ServerError(RequestError):
     """Raised for 5xx server errors."""
     pass
 
-def get_logger(log_file) -> logging.Logger:
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    file_handler = RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    return logger
+def new_log_file() -> str:
+    """Return the path of the log file for a new scraping run."""
+    os.makedirs(SCRAPER_LOG, exist_ok=True)
+    # Number after the highest existing run, so rotated backups or stray files can't cause a reuse
+    with os.scandir(SCRAPER_LOG) as entries:
+        last_run = max((int(e.name[8:-4]) for e in entries
+                        if e.name.startswith('scraper_') and e.name.endswith('.log') and e.name[8:-4].isdigit()),
+                       default=-1)
+    return SCRAPER_LOG+f'scraper_{last_run + 1}.log'
+
+def get_logger(name: str, log_file: str) -> logging.Logger:
+    """Return the logger of a scraper, writing to log_file.
+
+    Both scrapers log through the parent 'sinac' logger so a run keeps a single
+    file handler, which is replaced when a new run uses a different file.
+    """
+    parent = logging.getLogger('sinac')
+    parent.setLevel(logging.INFO)
+    if not any(getattr(handler, 'baseFilename', None) == os.path.abspath(log_file) for handler in parent.handlers):
+        for handler in parent.handlers[:]:
+            parent.removeHandler(handler)
+            handler.close()
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        file_handler = RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5)
+        file_handler.setFormatter(formatter)
+        parent.addHandler(file_handler)
+    return logging.getLogger(f'sinac.{name}')
+
+def create_session() -> httpx.AsyncClient:
+    """Create an HTTP/2 client with a keep-alive connection pool for the SINAC host."""
+    limits = httpx.Limits(max_connections=256, max_keepalive_connections=64, keepalive_expiry=60)
+    # Each scraper overrides the timeout per request in _fetch_data
+    return httpx.AsyncClient(http2=True, limits=limits, timeout=httpx.Timeout(30.0, connect=10.0))
+
+def save_feather(df: pd.DataFrame, path: str):
+    """Write a dataframe checkpoint in feather format.
+
+    Object columns may mix numbers and text across reds, which Arrow cannot store,
+    so they are written as strings.
+    """
+    object_cols = df.select_dtypes(include='object').columns
+    df.astype({col: 'string' for col in object_cols}).reset_index(drop=True).to_feather(path)
+
+def cache_key(url: str, payload: Union[Dict[str, str], bytes]) -> Tuple[str, Any]:
+    """Build the response cache key of a request."""
+    if isinstance(payload, bytes):
+        return url, payload
+    return url, tuple(sorted(payload.items()))
+
+def get_retry_after(response: httpx.Response) -> Optional[float]:
+    """Read the Retry-After header, given either in seconds or as an HTTP date.
+
+    The wait is clamped to MAX_RETRY_AFTER so a bogus header can't stall a scrape.
+    """
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = (retry_date - datetime.now(timezone.utc)).total_seconds()
+    return min(max(0.0, seconds), MAX_RETRY_AFTER)
+
+def wait_retry_after(fallback):
+    """Wait as long as the server asked in Retry-After, or use the fallback wait otherwise."""
+    def wait(retry_state: RetryCallState) -> float:
+        exception = retry_state.outcome.exception()
+        if isinstance(exception, TooManyRequestsError) and exception.retry_after is not None:
+            return exception.retry_after
+        return fallback(retry_state)
+    return wait
 
 def log_failure(retry_state: RetryCallState):
     if retry_state.attempt_number == RETRIES:    
         scraper_obj = retry_state.args[0]
         scraper_obj.logger.error(f"Failed to fetch data after {retry_state.attempt_number} attempts.")
-        payload = retry_state.args[3] 
+        # _fetch_data(self, session, url, payload, ...) may receive the payload by keyword
+        payload = retry_state.kwargs.get('payload', retry_state.args[3] if len(retry_state.args) > 3 else None)
         scraper_obj.logger.error(f"Payload: {payload}")
 
 def log_retry(retry_state: RetryCallState):
     scraper_obj = retry_state.args[0]
-    scraper_obj.logger.info(f"Retrying in {retry_state.next_action.sleep} seconds...")
+    # Skip formatting the message when INFO is disabled
+    if retry_state.next_action is not None and scraper_obj.logger.isEnabledFor(logging.INFO):
+        scraper_obj.logger.info(f"Retrying in {retry_state.next_action.sleep} seconds...")
 
 
 class SINACPayloadSraper:
-    def __init__(self, CA_codes: List[int]):
+    def __init__(self, CA_codes: List[int], session: Optional[httpx.AsyncClient] = None,
+                 max_in_flight: int = 64, log_file: Optional[str] = None, use_cache: bool = False):
+        self.session = session
+        # Responses can be cached on disk so restarts do not repeat identical requests
+        self.cache = diskcache.Cache(CACHE_PATH) if use_cache else None
+        # Bounds the number of requests in flight at any time
+        self.max_in_flight = max_in_flight
+        self.sem = asyncio.Semaphore(max_in_flight)
         self.base_urls = {
             'provinces': PROV_URL,
             'municipalities': MUN_URL
@@ -64,91 +161,89 @@ class SINACPayloadSraper:
         
         self.CA_codes = CA_codes
         self.communities = self._initialize_communities()
-        self.results_df = pd.DataFrame(
-            columns=['community_name', 'province', 'municipe', 'payload']
-        )
+        self._rows: List[Dict[str, Any]] = []
+        self.results_df = None
         self.save_path = PAYLOAD_PATH
-        os.makedirs(SCRAPER_LOG, exist_ok=True)
-        log_file = SCRAPER_LOG+f'scraper_{len(os.listdir(SCRAPER_LOG))}.log'
-        self.logger = get_logger(log_file)
+        log_file = log_file or new_log_file()
+        self.logger = get_logger('payload', log_file)
         self.logger.info("Logger file: " + log_file)
         self.logger.info("Starting the payload generation:\n")
 
-        self.timeout = ClientTimeout(total=30, connect=10, sock_read=10)
-        self.df_lock = asyncio.Lock()
+        self.timeout = httpx.Timeout(10.0, connect=10.0)
 
-    async def _save_results(self):
-        async with self.df_lock:
-            pickle.dump(self.results_df, open(self.save_path, 'wb'))
+    def _save_results(self):
+        save_feather(self.results_df, self.save_path)
 
     def _initialize_communities(self) -> List[Tuple[str, str]]:
         """Initialize the list of Spanish autonomous communities."""
         CA_names = [CA_NAMES[code-1] for code in self.CA_codes]
         return list(zip(self.CA_codes, CA_names))
 
-    @staticmethod
-    def _define_payload(cod_comunidad: str, cod_provincia: str, cod_municipio: str) -> Dict[str, str]:
-        """Create the payload for the final search request."""
-        return {
-            'codComunidad': cod_comunidad,
-            'codProvincia': cod_provincia,
-            'codMunicipio': cod_municipio,
-            'method': 'Buscar'
-        }
-
     @staticmethod
     def _parse_options(html_content: str) -> List[Tuple[str, str]]:
         """Parse HTML content and extract options with their values."""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        options = soup.find_all('option')
-        return [(option['value'], option.text) for option in options if option['value'] != '']
+        tree = HTMLParser(html_content)
+        return [
+            (option.attributes['value'], option.text())
+            for option in tree.css('option') if option.attributes.get('value')
+        ]
 
-    async def _handle_response(self, response: aiohttp.ClientResponse) -> str:
+    def _handle_response(self, response: httpx.Response) -> str:
         """Handle the response and raise appropriate exceptions."""
-        if response.status == 429:
-            raise TooManyRequestsError(f"Too many requests: {response.status}")
-        elif response.status >= 500:
-            raise ServerError(f"Server error: {response.status}")
-        elif response.status >= 400:
-            raise RequestError(f"Request error: {response.status}")
+        if response.status_code == 429:
+            raise TooManyRequestsError(f"Too many requests: {response.status_code}", get_retry_after(response))
+        elif response.status_code >= 500:
+            raise ServerError(f"Server error: {response.status_code}")
+        elif response.status_code >= 400:
+            raise RequestError(f"Request error: {response.status_code}")
             
-        try:
-            return await response.text()
-        except Exception as e:
-            raise NetworkError(f"Error reading response: {str(e)}")
+        # Decoded with the declared charset, selectolax would guess it and drop the accents it can't decode
+        return response.content.decode(response.charset_encoding or 'utf-8', errors='replace')
 
     @retry(
         stop=stop_after_attempt(RETRIES),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
+        wait=wait_retry_after(wait_random_exponential(multiplier=1, min=4, max=10)),
         retry=retry_if_exception_type((TooManyRequestsError, ServerError, NetworkError)),
-        before_sleep=lambda retry_state: log_retry(retry_state)
+        before_sleep=log_retry,
+        reraise=True
     )
     async def _fetch_data(
         self,
-        session: aiohttp.ClientSession,
+        session: httpx.AsyncClient,
         url: str,
         payload: Dict[str, str],
-        timeout: Optional[ClientTimeout] = None
+        timeout: Optional[httpx.Timeout] = None
     ) -> str:
         """
         Fetch data from the specified URL with the given payload.
         Includes rate limiting and error handling.
         """
+        key = cache_key(url, payload)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
         # await self.rate_limiter.acquire()
         
-        try:
-            async with session.post(url, data=payload, timeout=timeout or self.timeout) as response:
-                return await self._handle_response(response)
-                
-        except asyncio.TimeoutError as e:
-            self.logger.error(f"Timeout error for {url}: {str(e)}")
-            raise NetworkError(f"Request timed out: {str(e)}")
-        except aiohttp.ClientError as e:
-            self.logger.error(f"Client error for {url}: {str(e)}")
-            raise NetworkError(f"Network error: {str(e)}")
-        except Exception as e:
-            self.logger.error(f"Unexpected error fetching data from {url}: {str(e)}")
-            raise
+        async with self.sem:
+            try:
+                response = await session.post(url, data=payload, timeout=timeout or self.timeout)
+                content = self._handle_response(response)
+                    
+            except httpx.TimeoutException as e:
+                self.logger.error(f"Timeout error for {url}: {str(e)}")
+                raise NetworkError(f"Request timed out: {str(e)}")
+            except httpx.HTTPError as e:
+                self.logger.error(f"Client error for {url}: {str(e)}")
+                raise NetworkError(f"Network error: {str(e)}")
+            except Exception as e:
+                self.logger.error(f"Unexpected error fetching data from {url}: {str(e)}")
+                raise
+
+        if self.cache is not None:
+            self.cache.set(key, content, expire=CACHE_EXPIRE)
+        return content
 
     async def _process_municipality(
         self,
@@ -161,15 +256,16 @@ class SINACPayloadSraper:
     ):
         """Process a single municipality and store its data."""
         try:
-            final_payload = self._define_payload(community_id, province_id, municipality_id)
-            new_row = pd.DataFrame([{
+            # Plain rows are collected here and turned into a DataFrame once in scrape().
+            # The search payload is rebuilt from the codes by SINACRedScraper.
+            self._rows.append({
                 'community_name': community_name,
                 'province': province_name,
                 'municipe': municipality_name,
-                'payload': final_payload
-            }])
-            async with self.df_lock:
-                self.results_df = pd.concat([self.results_df, new_row], ignore_index=True)
+                'codComunidad': community_id,
+                'codProvincia': province_id,
+                'codMunicipio': municipality_id
+            })
         except Exception as e:
             self.logger.error(
                 f"Error processing municipality {municipality_name} in {province_name}: {str(e)}"
@@ -178,7 +274,7 @@ class SINACPayloadSraper:
 
     async def _process_province(
         self,
-        session: aiohttp.ClientSession,
+        session: httpx.AsyncClient,
         community_name: str,
         community_id: str,
         province_name: str,
@@ -193,25 +289,25 @@ class SINACPayloadSraper:
             )
             municipalities = self._parse_options(html_content)
             
-            await asyncio.gather(*[
-                self._process_municipality(
+            # No requests are made per municipality, so there is nothing to run concurrently
+            for muni_id, muni_name in municipalities:
+                await self._process_municipality(
                     community_name, community_id,
                     province_name, province_id,
                     muni_id, muni_name
                 )
-                for muni_id, muni_name in municipalities
-            ])
         except Exception as e:
             self.logger.error(f"Error processing province {province_name}: {str(e)}")
             raise
 
     async def _process_community(
         self,
-        session: aiohttp.ClientSession,
+        session: httpx.AsyncClient,
+        queue: asyncio.Queue,
         community_id: str,
         community_name: str
     ):
-        """Process all provinces in a community."""
+        """Fetch the provinces of a community and queue them for processing."""
         try:
             self.logger.info(f"Processing community: {community_name}")
             html_content = await self._fetch_data(
@@ -221,31 +317,51 @@ class SINACPayloadSraper:
             )
             provinces = self._parse_options(html_content)
             
-            await asyncio.gather(*[
-                self._process_province(
-                    session, community_name, community_id,
-                    province_name, province_id
-                )
-                for province_id, province_name in provinces
-            ])
-            await self._save_results()
+            for province_id, province_name in provinces:
+                queue.put_nowait(('province', community_name, community_id, province_name, province_id))
         except Exception as e:
             self.logger.error(f"Error processing community {community_name}: {str(e)}")
             raise
 
     async def scrape(self) -> pd.DataFrame:
         """Main method to scrape all data."""
-        timeout = ClientTimeout(total=300)  # 5 minutes total timeout for the entire session
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            try:
-                await asyncio.gather(*[
-                    self._process_community(session, comm_id, comm_name)
-                    for comm_id, comm_name in async_tqdm(self.communities)
-                ])
-                return self.results_df
-            except Exception as e:
-                self.logger.error(f"Error during scraping: {str(e)}")
-                raise
+        try:
+            if self.session is None:
+                async with create_session() as session:
+                    return await self._scrape(session)
+            return await self._scrape(self.session)
+        finally:
+            self.close()
+
+    def close(self):
+        """Close the response cache."""
+        if self.cache is not None:
+            self.cache.close()
+
+    async def _scrape(self, session: httpx.AsyncClient) -> pd.DataFrame:
+        try:
+            # Communities and provinces share one queue and one pool of workers, so a
+            # province is fetched as soon as its community answers
+            queue = asyncio.Queue()
+            for comm_id, comm_name in self.communities:
+                queue.put_nowait(('community', comm_id, comm_name))
+
+            async def process_item(kind: str, *args: str):
+                if kind == 'community':
+                    await self._process_community(session, queue, *args)
+                else:
+                    await self._process_province(session, *args)
+
+            await run_worker_pool(queue, process_item, self.max_in_flight)
+            self.results_df = pd.DataFrame(
+                self._rows,
+                columns=['community_name', 'province', 'municipe', 'codComunidad', 'codProvincia', 'codMunicipio']
+            ).astype('string[pyarrow]')
+            self._save_results()
+            return self.results_df
+        except Exception as e:
+            self.logger.error(f"Error during scraping: {str(e)}")
+            raise
 
     def run(self) -> pd.DataFrame:
         """Convenience method to run the scraper."""
@@ -254,11 +370,17 @@ class SINACPayloadSraper:
 
 
 class SINACRedScraper:
-    def __init__(self, payload_df: pd.DataFrame = None, calls_per_second: int = 30, progress_callback=None):
+    def __init__(self, payload_df: pd.DataFrame = None, calls_per_second: int = 30, progress_callback=None,
+                 session: Optional[httpx.AsyncClient] = None, max_in_flight: int = 64,
+                 log_file: Optional[str] = None, use_cache: bool = False):
+        self.session = session
+        # Responses can be cached on disk so restarts do not repeat identical requests
+        self.cache = diskcache.Cache(CACHE_PATH) if use_cache else None
+        self.max_in_flight = max_in_flight
         self.red_url = NET_URL
         self.content_url = CONTENT_URL
         self.payload_path = PAYLOAD_PATH
-        self.mun_payloads, self.munid2names = self._initialize_mun_payloads(payload_df)
+        self._mun_comm, self._mun_prov, self._mun_muni, self._mun_codes = self._initialize_mun_payloads(payload_df)
         self.progress_callback = progress_callback
         self.processed_municipalities = 0
         
@@ -277,6 +399,9 @@ class SINACRedScraper:
             'invalid': invalid_mun_df,
             'red': red_data_df
         }
+        # Results are accumulated in lists and materialized by _collect_results()
+        self._red_frames: List[pd.DataFrame] = []
+        self._invalid_rows: List[Tuple[str, str, str]] = []
 
         self.save_paths = {
             'payload': RED_PAYLOAD_PATH,
@@ -284,34 +409,60 @@ class SINACRedScraper:
             'red': RED_PATH
         }
 
-        # Initialize rate limiter
+        # Initialize rate limiter and the bound on requests in flight
         self.rate_limiter = RateLimiter(calls_per_second)
+        self.sem = asyncio.Semaphore(max_in_flight)
         
-        log_file = SCRAPER_LOG + f'scraper_{len(os.listdir(SCRAPER_LOG))-1}.log'
-        # Configure logging
-        logging.basicConfig(
-            filename=log_file,
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
-        self.logger = logging.getLogger(__name__)
+        log_file = log_file or new_log_file()
+        self.logger = get_logger('red', log_file)
         self.logger.info("Starting the red data extraction:\n")
 
-        self.timeout = ClientTimeout(total=180, connect=90, sock_read=90)
-        self.df_locks = {
-            'payload': asyncio.Lock(),
-            'invalid': asyncio.Lock(),
-            'red': asyncio.Lock()
-        }
+        self.timeout = httpx.Timeout(90.0)
+        self._form_headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        # pd.read_html is CPU bound, so it runs in a thread pool created by each scrape()
+        self._parser_pool: Optional[ThreadPoolExecutor] = None
 
-    async def _save_results(self, df_name: str):
-        async with self.df_locks[df_name]:
-            pickle.dump(self.dataframes[df_name], open(self.save_paths[df_name], 'wb'))
+    async def _save_results(self):
+        """Write a checkpoint of the current results to disk."""
+        # Only the lists are copied on the event loop, the concatenation runs in the thread with the writes
+        await asyncio.to_thread(self._write_checkpoint, list(self._red_frames), list(self._invalid_rows))
+
+    def _write_checkpoint(self, red_frames: List[pd.DataFrame], invalid_rows: List[Tuple[str, str, str]]):
+        """Build the dataframes from a snapshot of the results and write them. Runs in a worker thread."""
+        self._collect_results(red_frames, invalid_rows)
+        for df_name, df in self.dataframes.items():
+            save_feather(df, self.save_paths[df_name])
+
+    async def _periodic_checkpoint(self, stop: asyncio.Event, interval: float):
+        """Checkpoint the results every `interval` seconds until `stop` is set."""
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                await self._save_results()
+
+    def _collect_results(self, red_frames: List[pd.DataFrame], invalid_rows: List[Tuple[str, str, str]]):
+        """Build the red and invalid dataframes from the accumulated results."""
+        # The empty frame goes first so the output keeps the expected column order
+        self.dataframes['red'] = pd.concat(
+            [self.dataframes['red'].iloc[:0], *red_frames], ignore_index=True, copy=False
+        )
+        self.dataframes['invalid'] = pd.DataFrame(
+            invalid_rows, columns=self.dataframes['invalid'].columns
+        )
 
-    def _initialize_mun_payloads(self, payload_df: pd.DataFrame= None) -> Tuple[List, Dict[str, Dict[str, str]]]:
+    def _initialize_mun_payloads(
+        self, payload_df: pd.DataFrame= None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Tuple[str, str, str]]]:
+        """Load the community, province and municipality names and codes by position."""
         if payload_df is None:
-            payload_df = pickle.load(open(self.payload_path, 'rb'))
-        return payload_df['payload'].to_list(), payload_df[['community_name', 'province', 'municipe']].to_dict(orient='records')
+            payload_df = pd.read_feather(self.payload_path)
+        return (
+            payload_df['community_name'].to_numpy(),
+            payload_df['province'].to_numpy(),
+            payload_df['municipe'].to_numpy(),
+            list(zip(payload_df['codComunidad'], payload_df['codProvincia'], payload_df['codMunicipio']))
+        )
     
     async def _update_progress(self):
         if self.progress_callback:
@@ -319,99 +470,132 @@ class SINACRedScraper:
             await self.progress_callback(self.processed_municipalities)
 
     @staticmethod
-    def _define_payload(cod_comunidad: str, cod_provincia: str, cod_municipio: str, cod_red: str) -> Dict[str, str]:
-        """Create the payload for the final search request."""
-        return {
+    def _define_search_payload(cod_comunidad: str, cod_provincia: str, cod_municipio: str) -> bytes:
+        """Create the url-encoded body for the search of the reds in a municipality."""
+        return urlencode({
+            'codComunidad': cod_comunidad,
+            'codProvincia': cod_provincia,
+            'codMunicipio': cod_municipio,
+            'method': 'Buscar'
+        }).encode('ascii')
+
+    @staticmethod
+    def _define_payload(cod_comunidad: str, cod_provincia: str, cod_municipio: str, cod_red: str) -> bytes:
+        """Create the url-encoded body for the final search request."""
+        return urlencode({
             'codComunidad': cod_comunidad,
             'codProvincia': cod_provincia,
             'codMunicipio': cod_municipio,
             'idRed': cod_red
-        }
+        }).encode('ascii')
     
     @staticmethod
-    def _parse_table(html_content: str) -> List[Tuple[str, str]]:
+    def _parse_table(html_content: bytes, encoding: str) -> List[Tuple[str, str]]:
         """Parse HTML content and extract options with their values."""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        table = soup.find('table', id='red')
-        if not table:
+        # Decoded with the declared charset, selectolax would guess it and drop the accents it can't decode
+        table = HTMLParser(html_content.decode(encoding, errors='replace')).css_first('table#red')
+        if table is None:
             return []
         redes = []
-        for row in table.find_all('tr'):
-            link = row.find('a')
-            if link:
-                red_code = link['href'].split('eleccionRedDistribucion(')[1].split(')')[0]
-                red_name = link.text.strip()
+        for row in table.css('tr'):
+            link = row.css_first('a')
+            if link is not None:
+                red_code = link.attributes['href'].split('eleccionRedDistribucion(')[1].split(')')[0]
+                red_name = link.text().strip()
                 redes.append((red_code, red_name))
         return redes
     
     @staticmethod
-    def _parse_data(html_content: str) -> pd.DataFrame:
-        start_idx = html_content.find('Últimos valor notificado de los parámetros de la legislación vigente')
-        start_id_table = html_content[start_idx:].find('<table')
-        end_id_table = html_content[start_idx:].find('</table')
-
-        html_table = html_content[start_idx+start_id_table:start_idx+end_id_table] + '</table>' 
-        soup_table = BeautifulSoup(html_table, 'html.parser')
-
-        table = soup_table.find('table')
-        df = pd.read_html(str(table))[0]
-        df = df[df['Código'].isin(PARAMETER_CODES)]
+    def _parse_data(html_content: bytes, encoding: str) -> pd.DataFrame:
+        match = _TABLE_RE.search(html_content)
+        if match is None:
+            raise ValueError("No parameter table found in the red data")
+
+        # Only the table slice is decoded, with the charset the server declared
+        html_table = match.group(1).decode(encoding, errors='replace')
+        df = pd.read_html(StringIO(html_table), flavor='lxml')[0]
+        codes = pd.to_numeric(df['Código'], errors='coerce').to_numpy()
+        df = df.iloc[np.isin(codes, _PARAMETER_CODES_ARR)].copy()
         df.rename(columns={'Valor cuantificado': 'Valor'}, inplace=True)
         return df
 
-    async def _handle_response(self, response: aiohttp.ClientResponse, payload: Dict[str, str]) -> str:
+    def _handle_response(
+        self, response: httpx.Response, payload: Union[Dict[str, str], bytes], sent_at: float
+    ) -> Tuple[bytes, str]:
         """Handle the response and raise appropriate exceptions."""
-        if response.status == 429:
-            raise TooManyRequestsError(f"Too many requests: {response.status}")
-        elif response.status == 404:
+        if response.status_code == 429:
+            # Slow down every request, not only the one being retried
+            self.rate_limiter.decrease(sent_at)
+            raise TooManyRequestsError(f"Too many requests: {response.status_code}", get_retry_after(response))
+        elif response.status_code == 404:
             self.logger.error(f"Requesting URL with payload: {payload}")
-        elif response.status >= 500:
-            raise ServerError(f"Server error: {response.status}")
-        elif response.status >= 400:
-            raise RequestError(f"Request error: {response.status}")
+        elif response.status_code >= 500:
+            raise ServerError(f"Server error: {response.status_code}")
+        elif response.status_code >= 400:
+            raise RequestError(f"Request error: {response.status_code}")
             
-        try:
-            return await response.text()
-        except Exception as e:
-            raise NetworkError(f"Error reading response: {str(e)}")
+        # Only successful answers count towards raising the rate again
+        if response.is_success:
+            self.rate_limiter.increase()
+        # Decoding is left to the parsers with the declared charset, _parse_data only decodes the table slice
+        return response.content, response.charset_encoding or 'utf-8'
 
     @retry(
         stop=stop_after_attempt(RETRIES),
-        wait=wait_exponential(multiplier=1, min=4, max=60),
+        wait=wait_retry_after(wait_random_exponential(multiplier=1, min=4, max=60)),
         retry=retry_if_exception_type((TooManyRequestsError, ServerError, RequestError, NetworkError)),
-        before_sleep=lambda retry_state: log_retry(retry_state),
-        after=log_failure
+        before_sleep=log_retry,
+        after=log_failure,
+        reraise=True
     )
     async def _fetch_data(
         self,
-        session: aiohttp.ClientSession,
+        session: httpx.AsyncClient,
         url: str,
-        payload: Dict[str, str],
-        timeout: Optional[ClientTimeout] = None
-    ) -> str:
+        payload: Union[Dict[str, str], bytes],
+        timeout: Optional[httpx.Timeout] = None
+    ) -> Tuple[bytes, str]:
         """
         Fetch data from the specified URL with the given payload.
         Includes rate limiting and error handling.
         """
-        await self.rate_limiter.acquire()
-        
-        try:
-            async with session.post(url, data=payload, timeout=timeout or self.timeout) as response:
-                return await self._handle_response(response, payload)
-                
-        except asyncio.TimeoutError as e:
-            self.logger.error(f"Timeout error for {url}: {str(e)}")
-            raise NetworkError(f"Request timed out: {str(e)}")
-        except aiohttp.ClientError as e:
-            self.logger.error(f"Client error for {url}: {str(e)}")
-            raise NetworkError(f"Network error: {str(e)}")
-        except Exception as e:
-            self.logger.error(f"Unexpected error fetching data from {url}: {str(e)}")
-            raise
+        key = cache_key(url, payload)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        async with self.sem:
+            sent_at = await self.rate_limiter.acquire()
+            
+            try:
+                # Pre-encoded bodies skip the form encoder but need the form content type
+                if isinstance(payload, bytes):
+                    response = await session.post(
+                        url, content=payload, headers=self._form_headers, timeout=timeout or self.timeout
+                    )
+                else:
+                    response = await session.post(url, data=payload, timeout=timeout or self.timeout)
+                content = self._handle_response(response, payload, sent_at)
+                    
+            except httpx.TimeoutException as e:
+                self.logger.error(f"Timeout error for {url}: {str(e)}")
+                raise NetworkError(f"Request timed out: {str(e)}")
+            except httpx.HTTPError as e:
+                self.logger.error(f"Client error for {url}: {str(e)}")
+                raise NetworkError(f"Network error: {str(e)}")
+            except Exception as e:
+                self.logger.error(f"Unexpected error fetching data from {url}: {str(e)}")
+                raise
+
+        # Only successful responses are cached, a transient 404 must not mark the municipality invalid for a day
+        if self.cache is not None and response.status_code == 200:
+            self.cache.set(key, content, expire=CACHE_EXPIRE)
+        return content
 
     async def _process_red(
         self,
-        session: aiohttp.ClientSession,
+        session: httpx.AsyncClient,
         community_name: str,
         community_id: str,
         province_name: str,
@@ -424,19 +608,20 @@ class SINACRedScraper:
         """Process a single red and store its data."""
         try:
             red_payload = self._define_payload(community_id, province_id, municipe_id, red_id)
-            html_content = await self._fetch_data(
+            html_content, encoding = await self._fetch_data(
                 session,
                 self.content_url,
                 red_payload
             )
-            red_data = self._parse_data(html_content)
+            red_data = await asyncio.get_running_loop().run_in_executor(
+                self._parser_pool, self._parse_data, html_content, encoding
+            )
             if not red_data.empty:
                 red_data['Comunidad Autónoma'] = community_name
                 red_data['Provincia'] = province_name
                 red_data['Municipio'] = municipe_name
                 red_data['Nombre de Red'] = red_name
-                async with self.df_locks['red']:
-                    self.dataframes['red'] = pd.concat([self.dataframes['red'], red_data], ignore_index=True)
+                self._red_frames.append(red_data)
 
         except Exception as e:
             self.logger.error(
@@ -446,40 +631,42 @@ class SINACRedScraper:
 
     async def _process_mun_reds(
         self,
-        session: aiohttp.ClientSession,
-        mun_id: str,
-        payload: Dict[str, str]
+        session: httpx.AsyncClient,
+        mun_id: int
     ):
         """Process all reds in a municipality."""
         try:
-            html_content = await self._fetch_data(
+            cod_comunidad, cod_provincia, cod_municipio = self._mun_codes[mun_id]
+            payload = self._define_search_payload(cod_comunidad, cod_provincia, cod_municipio)
+            html_content, encoding = await self._fetch_data(
                 session,
                 self.red_url,
                 payload
             )
-            reds = self._parse_table(html_content)
+            reds = self._parse_table(html_content, encoding)
 
             if len(reds) == 0:
-                async with self.df_locks['invalid']:
-                    values = list(self.munid2names[mun_id].values())
-
-                    self.dataframes['invalid'] = pd.concat(
-                        [self.dataframes['invalid'], pd.DataFrame(values, index=self.dataframes['invalid'].columns).T],
-                        ignore_index=True
-                    )
+                self._invalid_rows.append((self._mun_comm[mun_id], self._mun_prov[mun_id], self._mun_muni[mun_id]))
                 await self._update_progress()
                 return
 
             
-            await asyncio.gather(*[
-                self._process_red(
-                    session, self.munid2names[mun_id]['community_name'], payload['codComunidad'],
-                    self.munid2names[mun_id]['province'], payload['codProvincia'], 
-                    self.munid2names[mun_id]['municipe'], payload['codMunicipio'],
-                    red_name, red_id)
+            red_tasks = [
+                asyncio.ensure_future(self._process_red(
+                    session, self._mun_comm[mun_id], cod_comunidad,
+                    self._mun_prov[mun_id], cod_provincia, 
+                    self._mun_muni[mun_id], cod_municipio,
+                    red_name, red_id))
                 for red_id, red_name in reds
-            ])
-            await asyncio.gather(*[self._save_results(df_name) for df_name in self.dataframes.keys()])
+            ]
+            try:
+                await asyncio.gather(*red_tasks)
+            except BaseException:
+                # gather leaves the sibling reds running when one fails, they must not outlive the scrape
+                for task in red_tasks:
+                    task.cancel()
+                await asyncio.gather(*red_tasks, return_exceptions=True)
+                raise
 
             await self._update_progress()
         except Exception as e:
@@ -487,23 +674,54 @@ class SINACRedScraper:
             raise
 
     async def scrape(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
-        timeout = ClientTimeout(total=300)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
+        # The pool is shut down by close(), so every scrape gets its own
+        self._parser_pool = ThreadPoolExecutor(max_workers=4)
+        try:
+            if self.session is None:
+                async with create_session() as session:
+                    return await self._scrape(session)
+            return await self._scrape(self.session)
+        finally:
+            self.close()
+
+    def close(self):
+        """Shut down the parser thread pool and the response cache."""
+        self._parser_pool.shutdown(wait=False, cancel_futures=True)
+        if self.cache is not None:
+            self.cache.close()
+
+    async def _scrape(self, session: httpx.AsyncClient) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        stop_checkpoint = asyncio.Event()
+        checkpoint_task = asyncio.create_task(self._periodic_checkpoint(stop_checkpoint, CHECKPOINT_INTERVAL))
+        completed = False
+        try:
+            # Municipalities are consumed from a queue by a fixed pool of workers
+            queue = asyncio.Queue()
+            for mun_id in range(len(self._mun_codes)):
+                queue.put_nowait((mun_id,))
+
+            with async_tqdm(total=len(self._mun_codes), desc="Extracting data") as pbar:
+                async def process_municipality(mun_id: int):
+                    await self._process_mun_reds(session, mun_id)
+                    pbar.update()
+
+                await run_worker_pool(queue, process_municipality, self.max_in_flight)
+            completed = True
+        except Exception as e:
+            self.logger.error(f"Error during scraping: {str(e)}")
+            raise
+        finally:
+            # The final checkpoint also collects the results returned below. If the scrape failed,
+            # checkpoint failures are only logged so they can't replace the error being raised.
+            stop_checkpoint.set()
             try:
-                # Create tasks
-                tasks = [
-                    self._process_mun_reds(session, mun_id, payload)
-                    for mun_id, payload in enumerate(self.mun_payloads)
-                ]
-                
-                # Use tqdm with asyncio.as_completed() for progress tracking
-                for f in async_tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Extracting data"):
-                    await f
-                
-                return self.dataframes['red'], self.dataframes['invalid']
+                await checkpoint_task
+                await self._save_results()
             except Exception as e:
-                self.logger.error(f"Error during scraping: {str(e)}")
-                raise
+                self.logger.error(f"Error writing the final checkpoint: {str(e)}")
+                if completed:
+                    raise
+        return self.dataframes['red'], self.dataframes['invalid']
 
     def run(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """Convenience method to run the scraper."""
@@ -1,11 +1,15 @@
 import hashlib
+import hmac
+import warnings
+
+# OpenSSL's sha256 uses the CPU's SHA extensions where available, the builtin fallback does not
+if type(hashlib.sha256()).__module__ != '_hashlib':
+    warnings.warn("hashlib is not backed by OpenSSL, password hashing will use the slower builtin SHA-256.")
 
 def make_hashes(password: str) -> str:
     """Convert password to a secure hash."""
-    return hashlib.sha256(str(password).encode('utf-8')).hexdigest()
+    return hashlib.sha256(password.encode()).hexdigest()
 
 def check_hashes(password: str, hashed_text: str) -> bool:
     """Check if the provided password matches the stored hash."""
-    if make_hashes(password) == hashed_text:
-        return True
-    return False
\ No newline at end of file
+    return hmac.compare_digest(make_hashes(password), hashed_text)
@@ -2,14 +2,46 @@ import time
 import asyncio
 
 class RateLimiter:
-    def __init__(self, requests_per_second):
-        self.requests_per_second = requests_per_second
+    def __init__(self, requests_per_second, min_requests_per_second=1, increase_every=50):
+        self.max_requests_per_second = requests_per_second
+        self.min_requests_per_second = min_requests_per_second
+        self.increase_every = increase_every
+        self.successes = 0
         self.last_request_time = 0
-        self.lock = asyncio.Lock()
-
-    async def acquire(self):
-        async with self.lock:
-            time_since_last_request = time.time() - self.last_request_time
-            if time_since_last_request < 1 / self.requests_per_second:
-                await asyncio.sleep(1 / self.requests_per_second - time_since_last_request)
-            self.last_request_time = time.time()
\ No newline at end of file
+        self.last_decrease_time = float('-inf')
+        self._set_rate(requests_per_second)
+
+    def _set_rate(self, requests_per_second):
+        # The interval is cached so acquire() does no division
+        self.requests_per_second = requests_per_second
+        self.interval = 1.0 / requests_per_second
+
+    async def acquire(self) -> float:
+        """Wait for the next free slot and return its time, to be passed back to decrease()."""
+        # Reserve the next free slot before sleeping. The event loop is single threaded,
+        # so the update needs no lock and waiters sleep concurrently on their own slots.
+        now = time.monotonic()
+        slot = max(self.last_request_time + self.interval, now)
+        self.last_request_time = slot
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        return slot
+
+    def decrease(self, sent_at: float = None):
+        """Halve the rate after the server answers with too many requests.
+
+        Requests sent before the last decrease were already in flight at the old rate, so
+        their 429s are ignored and one overload burst halves the rate only once.
+        """
+        if sent_at is not None and sent_at < self.last_decrease_time:
+            return
+        self.last_decrease_time = time.monotonic()
+        self._set_rate(max(self.min_requests_per_second, self.requests_per_second / 2))
+        self.successes = 0
+
+    def increase(self):
+        """Add one request per second back after every `increase_every` successful requests."""
+        self.successes += 1
+        if self.successes >= self.increase_every:
+            self.successes = 0
+            self._set_rate(min(self.max_requests_per_second, self.requests_per_second + 1))
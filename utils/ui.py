@@ -0,0 +1,239 @@
+from __future__ import annotations
+import streamlit as st
+import asyncio
+import os
+import time
+import uuid
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional
+if TYPE_CHECKING:
+    import pandas as pd
+try:
+    import uvloop  # Faster event loop, not available on Windows
+except ImportError:
+    uvloop = None
+from config import SCRAPER_LOG, LOG_FILENAME
+
+# pandas, openpyxl and the scraper are imported inside the functions that need them,
+# so the login page reruns without paying for those imports
+
+
+_DEFAULTS = {
+    'data_df': None,
+    'invalid_mun_df': None,
+    'data_preview': None,
+    'invalid_mun_preview': None,
+    'scrape_id': None,
+    'progress': 0,
+    'total_municipalities': 0,
+    'authenticated': False,
+}
+
+def initialize_session_state():
+    """Initialize session state variables if they don't exist."""
+    for key, value in _DEFAULTS.items():
+        st.session_state.setdefault(key, value)
+
+def _cancel_pending(loop: asyncio.AbstractEventLoop):
+    """Cancel and wait for the tasks left on the loop, as asyncio.run does before returning."""
+    pending = asyncio.all_tasks(loop)
+    for task in pending:
+        task.cancel()
+    if pending:
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+def _close_scrape_runtime(loop: asyncio.AbstractEventLoop, client):
+    """Close the HTTP client and the event loop of a session that has ended."""
+    try:
+        _cancel_pending(loop)
+        loop.run_until_complete(client.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+    except RuntimeError:
+        # Another loop is running in the collecting thread, the sockets are left to the garbage collector
+        pass
+    finally:
+        loop.close()
+
+class ScrapeRuntime:
+    """Event loop and HTTP client reused by the scrapes of one session, so connections outlive a single run.
+
+    They are kept per session rather than per process: every session runs its script in its own thread,
+    and two users scraping at once can't both run the same loop. Streamlit has no session end hook, so
+    both are closed by a finalizer once the session state is dropped.
+    """
+    def __init__(self):
+        from data.scraper import create_session
+        self.loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+        self.client = create_session()
+        weakref.finalize(self, _close_scrape_runtime, self.loop, self.client)
+
+    def run(self, coro):
+        """Run a coroutine on the loop. Whatever it leaves behind is cancelled, also when a rerun interrupts it."""
+        try:
+            return self.loop.run_until_complete(coro)
+        finally:
+            _cancel_pending(self.loop)
+
+def get_scrape_runtime() -> ScrapeRuntime:
+    """Return the scrape runtime of this session, creating it on the first scrape."""
+    if 'scrape_runtime' not in st.session_state:
+        st.session_state.scrape_runtime = ScrapeRuntime()
+    return st.session_state.scrape_runtime
+
+@st.cache_resource(show_spinner=False)
+def get_export_pool() -> ThreadPoolExecutor:
+    """Thread pool that builds XLSX files off the script thread."""
+    return ThreadPoolExecutor(max_workers=2)
+
+def _to_xlsx(df: pd.DataFrame) -> bytes:
+    """Serialize a dataframe to XLSX, streaming its rows into a write-only workbook."""
+    from io import BytesIO
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(df.columns))
+    # Missing values become empty cells, as with df.to_excel
+    for row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+        sheet.append(row)
+    output = BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _to_csv(_df: pd.DataFrame, scrape_id: str, filename: str) -> bytes:
+    """Serialize a dataframe to CSV. Cached per scrape and file, the dataframe itself is not hashed."""
+    from utils.export import fast_csv_bytes
+    return fast_csv_bytes(_df)
+
+def _xlsx_build(df: pd.DataFrame, filename: str) -> Future:
+    """Return the background XLSX build of a file for the current scrape, submitting it if needed."""
+    builds = st.session_state.setdefault('xlsx_builds', {})
+    build = builds.get(filename)
+    if build is None or build[0] != st.session_state.scrape_id:
+        build = builds[filename] = (st.session_state.scrape_id, get_export_pool().submit(_to_xlsx, df))
+    return build[1]
+
+@st.fragment(run_every=0.5)
+def _wait_for_xlsx(future: Future):
+    """Poll a pending XLSX build without blocking the page, and rerun the app once it has finished."""
+    if future.done():
+        st.rerun()
+    st.info('Generando XLSX...')
+
+def download_button(df: pd.DataFrame, filename: str, button_text: str, file_format: str = 'CSV'):
+    """Create a download button for a dataframe."""
+    if df is not None and not df.empty:
+        # XLSX is only built when explicitly requested, CSV is much cheaper to produce
+        if file_format == 'XLSX':
+            future = _xlsx_build(df, filename)
+            if not future.done():
+                _wait_for_xlsx(future)
+                return
+            if future.exception() is not None:
+                # A failed build is dropped so the next rerun tries again
+                del st.session_state.xlsx_builds[filename]
+                st.error(f"No se ha podido generar el XLSX: {future.exception()}")
+                return
+            data = future.result()
+            mime = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        else:
+            data = _to_csv(df, st.session_state.scrape_id, filename)
+            filename = os.path.splitext(filename)[0] + '.csv'
+            mime = 'text/csv'
+        st.download_button(
+            label=button_text,
+            data=data,
+            file_name=filename,
+            mime=mime,
+            key=filename  # Unique key to prevent button disappearance
+        )
+
+@st.cache_data(show_spinner=False)
+def _latest_log_file(dir_path: str, dir_mtime: float) -> Optional[str]:
+    """Find the most recent scraper log, or None if there is none. Cached until a file is added to the directory."""
+    with os.scandir(dir_path) as entries:
+        latest = max((e for e in entries if e.name.startswith('scraper_') and e.name.endswith('.log')),
+                     key=lambda e: e.stat().st_mtime, default=None)
+    return latest.path if latest is not None else None
+
+@st.cache_data(show_spinner=False)
+def _load_log(log_file: str, mtime: float, size: int) -> bytes:
+    """Read a log file as raw bytes. Cached until the file changes."""
+    with open(log_file, 'rb') as f:
+        return f.read()
+
+def download_log():
+    # A scrape that failed before any scraper opened its log leaves nothing to download
+    if not os.path.isdir(SCRAPER_LOG):
+        return
+    log_file = _latest_log_file(SCRAPER_LOG, os.stat(SCRAPER_LOG).st_mtime)
+    if log_file is None:
+        return
+    log_stat = os.stat(log_file)
+    log = _load_log(log_file, log_stat.st_mtime, log_stat.st_size)
+    st.download_button(
+        label="Descargar Log de Errores",
+        data=log,
+        file_name=LOG_FILENAME,
+        mime='text/plain',
+        key="error_log"
+    )
+
+def scrape(com_ids: list) -> bool:
+    """Scrape the given communities into session state, reporting progress. Returns whether it succeeded."""
+    from data.scraper import SINACPayloadSraper, SINACRedScraper, new_log_file
+    # Create a progress bar
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    
+    with st.spinner('Escrapeando datos...'):
+        try:
+            # First get the payloads (this will tell us total municipalities)
+            # Reuse the session's loop and client across scrapes to keep connections alive
+            runtime = get_scrape_runtime()
+            log_file = new_log_file()
+            payload_scraper = SINACPayloadSraper(com_ids, session=runtime.client, log_file=log_file)
+            payload_df = runtime.run(payload_scraper.scrape())
+            
+            # Initialize the total municipalities count
+            total_municipalities = len(payload_df)
+            st.session_state.total_municipalities = total_municipalities
+            
+            # Create data scraper with progress callback
+            # Each update is a round trip to the frontend, so render at most ~20 times per second
+            last_render = 0.0
+            async def progress_callback(completed_municipalities):
+                nonlocal last_render
+                now = time.monotonic()
+                if completed_municipalities < total_municipalities and now - last_render < 0.05:
+                    return
+                last_render = now
+                percent = completed_municipalities * 100 // total_municipalities
+                progress_bar.progress(percent)
+                status_text.text(f"Hemos procesado {completed_municipalities} de {total_municipalities} municipios ({percent}%)")
+            
+            data_scraper = SINACRedScraper(payload_df, progress_callback=progress_callback, session=runtime.client, log_file=log_file)
+            data_df, invalid_mun_df = runtime.run(data_scraper.scrape())
+            
+            # Store the sorted results in session state, under a new id that keys the download caches
+            st.session_state.scrape_id = uuid.uuid4().hex
+            st.session_state.data_df = data_df.sort_values(
+                by=['Comunidad Autónoma', 'Provincia', 'Municipio', 'Nombre de Red', 'Código'],
+                kind='stable', ignore_index=True
+            )
+            st.session_state.invalid_mun_df = invalid_mun_df.sort_values(
+                by=['Comunidad Autónoma', 'Provincia', 'Municipio'],
+                kind='stable', ignore_index=True
+            )
+            # Small previews are taken once here rather than sliced again on every rerun
+            st.session_state.data_preview = st.session_state.data_df.head(9).copy()
+            st.session_state.invalid_mun_preview = st.session_state.invalid_mun_df.head().copy()
+            st.success("¡Datos escrapeados con éxito!")
+            return True
+
+        except Exception as e:
+            # create a download button for the error log
+            st.write(e)
+            st.write("Ha ocurrido un error. Por favor, descargue el log de errores y envíelo a Edu.")
+            return False
@@ -0,0 +1,31 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+async def run_worker_pool(queue: asyncio.Queue, handler: Callable[..., Awaitable[Any]], num_workers: int):
+    """Consume every item of the queue with a fixed number of worker tasks.
+
+    Each item is a tuple of arguments for the handler. Handlers may put new items
+    on the queue while the pool is running. The first failing handler stops the
+    pool and its exception is re-raised.
+    """
+    async def worker():
+        while True:
+            item = await queue.get()
+            try:
+                await handler(*item)
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(num_workers)]
+    join_task = asyncio.create_task(queue.join())
+    try:
+        await asyncio.wait([join_task, *workers], return_when=asyncio.FIRST_COMPLETED)
+        for task in workers:
+            if task.done():
+                task.result()
+    finally:
+        join_task.cancel()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(join_task, *workers, return_exceptions=True)